@@ -1,131 +1,1726 @@
+import base64
+import bisect
+import contextvars
 import datetime
 import fabric.functions as udf
+import functools
+import importlib
 import logging
 import json 
+import os
+import random
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# pandas, numpy and pyarrow are imported inside the functions that use them, so
+# a cold worker can answer hello_fabric without paying for them at module load
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
 app = udf.FabricApp()
 
-@app.function("hello_fabric")
+
+# Instrumentation
+# Every registered function is timed as a whole and by named phases (connect,
+# execute, fetch, download, parse, compute, serialize, ...). Phase times are
+# exclusive: time spent in a nested phase is not counted again in its parent.
+# Each call emits one structured log line and feeds rolling latency histograms
+# (log-spaced buckets over the last one to two INSTRUMENTATION_WINDOW periods),
+# which get_diagnostics reports as p50/p95/p99. Recording a sample is a bisect
+# and a counter increment, so this stays on in production. The log line also
+# carries a cheap measure of the request (the length of its text arguments and
+# the number of items in its top-level lists) and the change in resident memory
+# over the call. Set INSTRUMENT_REQUEST_BYTES_SAMPLE to a fraction of calls to
+# also log the full JSON size of their arguments, which costs a serialization
+# of the payload, and INSTRUMENT_TRACEMALLOC=1 to add the peak Python allocation
+# of each call, which slows every allocation down and is only exact while calls
+# do not overlap.
+INSTRUMENTATION_WINDOW = 300
+LATENCY_BUCKETS_MS = [0.01 * 1.2 ** i for i in range(90)]  # 0.01 ms to ~130 s
+INSTRUMENT_REQUEST_BYTES_SAMPLE = float(os.environ.get("INSTRUMENT_REQUEST_BYTES_SAMPLE", "0"))
+INSTRUMENT_TRACEMALLOC = os.environ.get("INSTRUMENT_TRACEMALLOC", "0") == "1"
+
+
+class LatencyHistogram:
+    """Latency counts in log-spaced buckets over a rolling window."""
+
+    def __init__(self, window=INSTRUMENTATION_WINDOW):
+        self.window = window
+        self._current = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._previous = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._started = time.monotonic()
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._started >= self.window:
+            stale = now - self._started >= 2 * self.window
+            self._previous = [0] * len(self._current) if stale else self._current
+            self._current = [0] * len(self._current)
+            self._started = now
+
+    def add(self, ms: float):
+        self._rotate()
+        self._current[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+
+    def percentiles(self, quantiles=(50, 95, 99)) -> dict:
+        # Each percentile is reported as the upper bound of its bucket
+        self._rotate()
+        counts = [a + b for a, b in zip(self._current, self._previous)]
+        total = sum(counts)
+        result = {}
+        for q in quantiles:
+            if not total:
+                result[f"p{q}"] = None
+                continue
+            rank, seen = q / 100 * total, 0
+            for index, count in enumerate(counts):
+                seen += count
+                if seen >= rank:
+                    break
+            result[f"p{q}"] = round(LATENCY_BUCKETS_MS[min(index, len(LATENCY_BUCKETS_MS) - 1)], 3)
+        result["count"] = total
+        return result
+
+
+class FunctionStats:
+    def __init__(self):
+        self.calls = self.errors = 0
+        self.latency = LatencyHistogram()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def observe(self, elapsed_ms: float, phases: dict, failed: bool):
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+            self.latency.add(elapsed_ms)
+            for name, ms in phases.items():
+                histogram = self.phases.get(name)
+                if histogram is None:
+                    histogram = self.phases[name] = LatencyHistogram()
+                histogram.add(ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "latencyMs": self.latency.percentiles(),
+                "phasesMs": {name: h.percentiles() for name, h in self.phases.items()},
+            }
+
+
+class Invocation:
+    __slots__ = ("phases", "metrics", "_stacks")
+
+    def __init__(self):
+        self.phases = {}
+        self.metrics = {}
+        self._stacks = {}  # thread id -> time spent in nested phases, per open phase
+
+
+function_stats = {}
+_current_invocation = contextvars.ContextVar("current_invocation", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    # Times a named phase of the current invocation; a no-op outside of one
+    invocation = _current_invocation.get()
+    if invocation is None:
+        yield
+        return
+    stack = invocation._stacks.setdefault(threading.get_ident(), [])
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        invocation.phases[name] = invocation.phases.get(name, 0.0) + (elapsed - nested) * 1000
+
+
+def record_metric(name: str, value):
+    # Attaches a size or count (e.g. rows, bytes downloaded) to the current invocation
+    invocation = _current_invocation.get()
+    if invocation is not None:
+        invocation.metrics[name] = invocation.metrics.get(name, 0) + value
+
+
+def peak_rss_mb():
+    # Peak resident memory of the worker process (ru_maxrss is in KiB on Linux)
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def rss_bytes():
+    # Current resident memory of the worker process, where /proc is available
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def request_size(args, kwargs) -> dict:
+    # Characters in text arguments and items in list arguments, looking up to
+    # two levels into dict arguments; lists are counted, not traversed
+    size = {"requestChars": 0, "requestItems": 0}
+
+    def add(value, depth=0):
+        if isinstance(value, (str, bytes)):
+            size["requestChars"] += len(value)
+        elif isinstance(value, (list, tuple)):
+            size["requestItems"] += len(value)
+        elif isinstance(value, dict) and depth < 2:
+            for item in value.values():
+                add(item, depth + 1)
+
+    for value in list(args) + list(kwargs.values()):
+        add(value)
+    if INSTRUMENT_REQUEST_BYTES_SAMPLE and random.random() < INSTRUMENT_REQUEST_BYTES_SAMPLE:
+        # Fabric items bound to the call count as null
+        size["requestBytes"] = len(json.dumps([args, kwargs], default=lambda _: None))
+    return size
+
+
+if INSTRUMENT_TRACEMALLOC:
+    import tracemalloc
+
+    tracemalloc.start()
+
+
+def instrument(name: str, func):
+    stats = function_stats.setdefault(name, FunctionStats())
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        invocation = Invocation()
+        token = _current_invocation.set(invocation)
+        log = logging.getLogger().isEnabledFor(logging.INFO)
+        if log:
+            invocation.metrics.update(request_size(args, kwargs))
+            rss_start = rss_bytes()
+            if INSTRUMENT_TRACEMALLOC:
+                traced_start = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+        start = time.perf_counter()
+        error = None
+        try:
+            result = func(*args, **kwargs)
+            if isinstance(result, (str, bytes)):
+                invocation.metrics["responseSize"] = len(result)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            _current_invocation.reset(token)
+            stats.observe(elapsed_ms, invocation.phases, error is not None)
+            if log:
+                memory = {}
+                rss_end = rss_bytes()
+                if rss_end is not None:
+                    memory["rssMb"] = round(rss_end / 2**20, 1)
+                    memory["rssDeltaMb"] = round((rss_end - rss_start) / 2**20, 1)
+                if INSTRUMENT_TRACEMALLOC:
+                    memory["allocPeakMb"] = round((tracemalloc.get_traced_memory()[1] - traced_start) / 2**20, 1)
+                logging.info(json.dumps({
+                    "event": "function_invocation",
+                    "function": name,
+                    "status": "ok" if error is None else type(error).__name__,
+                    "durationMs": round(elapsed_ms, 3),
+                    "phasesMs": {k: round(v, 3) for k, v in invocation.phases.items()},
+                    "metrics": invocation.metrics,
+                    "memory": memory,
+                }))
+    return wrapper
+
+
+# The plain Python callable behind every function registered with the app, by
+# function name. The Fabric decorators replace the module-level names with
+# function builders, so in-process callers go through this mapping instead.
+functions = {}
+
+
+def fabric_function(name: str):
+    # Use in place of @app.function(name); the registered function is instrumented
+    def decorator(func):
+        functions[name] = func
+        return app.function(name)(instrument(name, func))
+    return decorator
+
+
+@fabric_function("hello_fabric")
 def hello_fabric(name: str) -> str:
     logging.info('Python UDF trigger function processed a request.')
 
     return f"Welcome to Fabric Functions, {name}, at {datetime.datetime.now()}!"
 
 
+# Connection pooling for SQL-backed functions
+# Opening a connection (TLS handshake + token login) costs far more than running
+# a small query, so every SQL-backed function in this app borrows connections
+# from a pool that lives as long as the worker process.
+SQL_POOL_SIZE = 4  # Maximum number of open connections per data connection alias
+SQL_POOL_IDLE_TIMEOUT = 300  # Close connections that have been idle for this many seconds
+SQL_POOL_HEALTH_CHECK_INTERVAL = 30  # Ping connections idle for longer than this before reusing them
+SQL_POOL_ACQUIRE_TIMEOUT = 30  # Seconds to wait for a free connection when the pool is exhausted
+
+
+def is_sql_connection_error(error: Exception) -> bool:
+    # pyodbc puts the SQLSTATE first in the error's args; class 08 is a
+    # connection exception (e.g. 08S01, communication link failure)
+    state = error.args[0] if error.args else None
+    if isinstance(state, str) and re.match(r"^08[0-9A-Z]{3}$", state):
+        return True
+    try:
+        import pyodbc
+    except ImportError:
+        return False
+    return isinstance(error, (pyodbc.OperationalError, pyodbc.InterfaceError))
+
+
+class SqlConnectionPool:
+    """A bounded pool of DB-API connections created by a connect() factory."""
+
+    def __init__(self, connect, size=SQL_POOL_SIZE, idle_timeout=SQL_POOL_IDLE_TIMEOUT,
+                 health_check_interval=SQL_POOL_HEALTH_CHECK_INTERVAL, health_check_query="SELECT 1;",
+                 is_connection_error=None):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.connect = connect
+        self.is_connection_error = is_connection_error or is_sql_connection_error
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check_query = health_check_query
+        self._idle = deque()  # (connection, last_used) pairs, most recently used on the right
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self.connects = 0
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            logging.debug("Ignoring error while closing a pooled SQL connection.", exc_info=True)
+
+    def _is_healthy(self, connection) -> bool:
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(self.health_check_query)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            logging.warning("Discarding a pooled SQL connection that failed its health check.")
+            return False
+
+    def evict_idle(self):
+        # Close every idle connection that has outlived the idle timeout
+        now = time.monotonic()
+        with self._lock:
+            expired = [c for c, last_used in self._idle if now - last_used > self.idle_timeout]
+            self._idle = deque((c, t) for c, t in self._idle if now - t <= self.idle_timeout)
+        for connection in expired:
+            self._close(connection)
+
+    def _checkout(self, fresh=False):
+        # Returns (connection, reused); the caller must already hold a slot
+        self.evict_idle()
+        while not fresh:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, last_used = self._idle.pop()
+            if time.monotonic() - last_used <= self.health_check_interval:
+                return connection, True
+            with phase("health_check"):
+                healthy = self._is_healthy(connection)
+            if healthy:
+                return connection, True
+            self._close(connection)
+        with phase("connect"):
+            connection = self.connect()
+        with self._lock:
+            self.connects += 1
+        return connection, False
+
+    def _checkin(self, connection, discard=False):
+        if discard:
+            self._close(connection)
+        else:
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+
+    def _recover(self, connection) -> bool:
+        # After a query or input error the connection itself is fine; roll back
+        # whatever the failed work left open so it can go back to the pool
+        try:
+            connection.rollback()
+            return True
+        except Exception:
+            logging.debug("Discarding a pooled SQL connection that failed to roll back.", exc_info=True)
+            return False
+
+    @contextmanager
+    def _borrow(self, timeout, fresh=False):
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"No SQL connection became available within {timeout} seconds")
+        try:
+            connection, reused = self._checkout(fresh)
+        except Exception:
+            self._slots.release()
+            raise
+        discard = True
+        try:
+            yield connection, reused
+            discard = False
+        except Exception as error:
+            discard = self.is_connection_error(error) or not self._recover(connection)
+            raise
+        finally:
+            self._checkin(connection, discard=discard)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=SQL_POOL_ACQUIRE_TIMEOUT):
+        """Borrow a connection; it is discarded instead of returned if the block raises a connection error."""
+        with self._borrow(timeout) as (connection, _):
+            yield connection
+
+    def run(self, work, timeout=SQL_POOL_ACQUIRE_TIMEOUT):
+        """
+        Call work(connection) with a pooled connection and return its result.
+
+        If work fails with a connection error on a connection that was reused
+        from the pool, the connection may have gone stale, so it is dropped and
+        work is retried once on a fresh connection. Query and input errors are
+        raised as they are. Only pass idempotent work (reads).
+        """
+        reused = False
+        try:
+            with self._borrow(timeout) as (connection, reused):
+                return work(connection)
+        except Exception as error:
+            if not reused or not self.is_connection_error(error):
+                raise
+            logging.warning("Connection error on a reused SQL connection; reconnecting and retrying once.")
+        with self._borrow(timeout, fresh=True) as (connection, _):
+            return work(connection)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "idle": len(self._idle), "connects": self.connects}
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self._close(connection)
+
+
+_sql_pools = {}
+_sql_pools_lock = threading.Lock()
+
+
+def get_sql_pool(alias: str, sql_connection: udf.FabricSqlConnection) -> SqlConnectionPool:
+    # One pool per data connection alias, shared by every function in this app.
+    # The factory is refreshed on every call so that new connections are always
+    # opened with the latest access token handed to the function.
+    with _sql_pools_lock:
+        pool = _sql_pools.get(alias)
+        if pool is None:
+            pool = _sql_pools[alias] = SqlConnectionPool(sql_connection.connect)
+        else:
+            pool.connect = sql_connection.connect
+        return pool
+
+
+def fetch_all(connection, query: str, params=()) -> list:
+    cursor = connection.cursor()
+    try:
+        with phase("execute"):
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+        with phase("fetch"):
+            rows = [list(row) for row in cursor.fetchall()]
+        record_metric("rows", len(rows))
+        return rows
+    finally:
+        cursor.close()
+
+
 # This sample allows you to read data from Azure SQL database 
 # Complete these steps before testing this funtion 
 #   1. Select Manage connections to connect to Azure SQL database 
 
 
 @app.fabric_item_input(argName="sqlDB",alias="sqlDB")
-@app.function("read_from_azure_sql_db")
+@fabric_function("read_from_azure_sql_db")
 def read_from_azure_sql_db(sqlDB: udf.FabricSqlConnection)->str:
     # Replace with the query you want to run
-      query = "SELECT * FROM (VALUES ('John Smith', 31), ('Kayla Jones', 33)) AS Employee(EmpName, DepID);"
-  
-      # Establish a connection to the SQL database
-      connection = sqlDB.connect()
-      cursor = connection.cursor()
-  
-      # Execute the query
-      cursor.execute(query)
-  
-      # Fetch all results
-      results = []
-      for row in cursor.fetchall():
-          results.append(row)
-  
-      # Close the connection
-      cursor.close()
-      connection.close()  
-      resultsJSON = json.dumps({"values": results})          
-      return results
-
-import pandas as pd
-@app.function("manipulate_data")
+    query = "SELECT * FROM (VALUES ('John Smith', 31), ('Kayla Jones', 33)) AS Employee(EmpName, DepID);"
+
+    # Borrow a connection from the shared pool, execute the query and fetch all results.
+    # The connection goes back to the pool instead of being closed.
+    pool = get_sql_pool("sqlDB", sqlDB)
+    results = pool.run(lambda connection: fetch_all(connection, query))
+    return results
+
+
+# Paged, batched reads
+# Rows are pulled from the cursor with fetchmany() and serialized one batch at a
+# time, so only a single batch of driver row objects is alive at once. Callers
+# page through large tables with keyset pagination (afterKey) or limit/offset.
+SQL_FETCH_BATCH_SIZE = 5000  # Rows per fetchmany() call
+SQL_PAGE_MAX_ROWS = 100000  # Upper bound on the rows returned by a single call
+SQL_PAGE_FORMATS = ("ndjson", "arrow")
+_SQL_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$")
+
+
+def quote_identifier(name: str) -> str:
+    if not _SQL_IDENTIFIER.match(name or ""):
+        raise udf.UserDataFunctionInvalidInputError(f"'{name}' is not a valid table or column name.")
+    return ".".join(f"[{part}]" for part in name.split("."))
+
+
+def iter_row_batches(cursor, batch_size: int = SQL_FETCH_BATCH_SIZE):
+    while True:
+        with phase("fetch"):
+            rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def rows_to_ndjson(columns: list, batches) -> str:
+    # One JSON object per line; each batch is encoded before the next is fetched
+    chunks = []
+    for rows in batches:
+        chunks.append("".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in rows))
+    return "".join(chunks)
+
+
+def arrow_schema(description) -> tuple:
+    # Builds the Arrow schema from cursor.description, so a column whose first
+    # batch is all NULL still gets its declared type. Returns (schema, as_text),
+    # where as_text flags columns of other Python types, sent as their str().
+    import decimal
+
+    import pyarrow as pa
+
+    types = {
+        bool: pa.bool_(), int: pa.int64(), float: pa.float64(), str: pa.string(),
+        bytes: pa.binary(), bytearray: pa.binary(), datetime.datetime: pa.timestamp("us"),
+        datetime.date: pa.date32(), datetime.time: pa.time64("us"),
+    }
+    fields, as_text = [], []
+    for name, type_code, _, _, precision, scale, *_ in description:
+        if type_code is decimal.Decimal and precision and 0 < precision <= 38:
+            arrow_type = pa.decimal128(precision, scale or 0)
+        else:
+            arrow_type = types.get(type_code)
+        as_text.append(arrow_type is None)
+        fields.append(pa.field(name, arrow_type or pa.string()))
+    return pa.schema(fields), as_text
+
+
+def rows_to_arrow_ipc(description, batches) -> bytes:
+    # Arrow IPC stream with one record batch per fetchmany() batch
+    import pyarrow as pa
+
+    schema, as_text = arrow_schema(description)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in batches:
+            arrays = []
+            for values, field, text in zip(zip(*rows), schema, as_text):
+                if text:
+                    values = [None if v is None else str(v) for v in values]
+                arrays.append(pa.array(values, type=field.type))
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+    return sink.getvalue().to_pybytes()
+
+
+def build_page_query(table: str, key_column: str, limit: int, offset: int = 0, after_key=None):
+    # Keyset pagination seeks straight to afterKey through the key's index; offset
+    # pagination has to skip offset rows, so prefer afterKey for deep pages.
+    table, key = quote_identifier(table), quote_identifier(key_column)
+    if after_key is not None:
+        return f"SELECT TOP (?) * FROM {table} WHERE {key} > ? ORDER BY {key};", (limit, after_key)
+    return f"SELECT * FROM {table} ORDER BY {key} OFFSET ? ROWS FETCH NEXT ? ROWS ONLY;", (offset, limit)
+
+
+def read_page(connection, query: str, params, key_column: str, output_format: str = "ndjson",
+              batch_size: int = SQL_FETCH_BATCH_SIZE) -> dict:
+    cursor = connection.cursor()
+    try:
+        with phase("execute"):
+            cursor.execute(query, params)
+        columns = [d[0] for d in cursor.description]
+        key_name = key_column.split(".")[-1]
+        if key_name not in columns:
+            raise udf.UserDataFunctionInvalidInputError(f"keyColumn '{key_column}' is not among the returned columns.")
+        key_index = columns.index(key_name)
+        page = {"rows": 0, "lastKey": None}
+
+        def counted(batches):
+            for rows in batches:
+                page["rows"] += len(rows)
+                last_key = rows[-1][key_index]
+                page["lastKey"] = last_key if isinstance(last_key, (int, float, str)) else str(last_key)
+                yield rows
+
+        batches = counted(iter_row_batches(cursor, batch_size))
+        with phase("serialize"):
+            if output_format == "ndjson":
+                data = rows_to_ndjson(columns, batches)
+            elif output_format == "arrow":
+                data = base64.b64encode(rows_to_arrow_ipc(cursor.description, batches)).decode("ascii")
+            else:
+                raise udf.UserDataFunctionInvalidInputError(f"format must be one of {list(SQL_PAGE_FORMATS)}.")
+    finally:
+        cursor.close()
+    record_metric("rows", page["rows"])
+    return {"format": output_format, "columns": columns, "data": data, **page}
+
+
+@app.fabric_item_input(argName="sqlDB",alias="sqlDB")
+@fabric_function("read_from_azure_sql_db_paged")
+def read_from_azure_sql_db_paged(sqlDB: udf.FabricSqlConnection, tableName: str, keyColumn: str,
+                                 limit: int = 10000, offset: int = 0, afterKey: str = None,
+                                 batchSize: int = SQL_FETCH_BATCH_SIZE, format: str = "ndjson") -> dict:
+    # Returns one page of tableName ordered by keyColumn as NDJSON text or a
+    # base64-encoded Arrow IPC stream. Pass the returned lastKey as afterKey to
+    # fetch the next page; a page shorter than limit is the last one.
+    if not 0 < limit <= SQL_PAGE_MAX_ROWS:
+        raise udf.UserDataFunctionInvalidInputError(f"limit must be between 1 and {SQL_PAGE_MAX_ROWS}.")
+    if offset < 0 or batchSize < 1:
+        raise udf.UserDataFunctionInvalidInputError("offset must be >= 0 and batchSize must be >= 1.")
+    if format not in SQL_PAGE_FORMATS:
+        raise udf.UserDataFunctionInvalidInputError(f"format must be one of {list(SQL_PAGE_FORMATS)}.")
+    query, params = build_page_query(tableName, keyColumn, limit, offset, afterKey)
+
+    pool = get_sql_pool("sqlDB", sqlDB)
+    return pool.run(lambda connection: read_page(connection, query, params, keyColumn, format, batchSize))
+
+
+# Age bucketing for manipulate_data
+# An age falls in bucket i when AGE_GROUP_EDGES[i-1] <= age < AGE_GROUP_EDGES[i],
+# so there is always one more label than there are edges.
+AGE_GROUP_EDGES = [18]
+AGE_GROUP_LABELS = ["Minor", "Adult"]
+
+
+def read_age_column(items) -> "np.ndarray":
+    # Accepts row records (a list of dicts), a columnar payload (a dict of
+    # arrays) or a base64-encoded Arrow IPC stream, and returns only the Age column.
+    import numpy as np
+
+    if isinstance(items, dict):
+        return np.asarray(items["Age"], dtype=np.float64)
+    if isinstance(items, str):
+        import pyarrow as pa
+
+        table = pa.ipc.open_stream(base64.b64decode(items)).read_all()
+        return table.column("Age").to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+    return np.array([item.get("Age") for item in items], dtype=np.float64)
+
+
+def age_group_means_batch(age_arrays: list, edges=AGE_GROUP_EDGES, labels=AGE_GROUP_LABELS) -> "pd.DataFrame":
+    # Buckets and averages several Age columns (segments) in one pass over their
+    # concatenation, keyed by (segment, bucket)
+    import numpy as np
+    import pandas as pd
+
+    if len(labels) != len(edges) + 1:
+        raise udf.UserDataFunctionInvalidInputError("There must be exactly one more label than bucket edges.")
+    edges = np.asarray(edges, dtype=np.float64)
+    if np.any(np.diff(edges) <= 0):
+        raise udf.UserDataFunctionInvalidInputError("Bucket edges must be strictly increasing.")
+
+    ages = np.concatenate(age_arrays) if age_arrays else np.empty(0)
+    segments = np.repeat(np.arange(len(age_arrays)), [len(a) for a in age_arrays])
+
+    # Bucket every age at once; missing ages land in the first bucket (as
+    # 'x >= 18' is False for NaN) but do not count towards its mean.
+    missing = np.isnan(ages)
+    buckets = np.where(missing, 0, np.searchsorted(edges, ages, side="right"))
+    keys = segments * len(labels) + buckets
+    size = len(age_arrays) * len(labels)
+    rows = np.bincount(keys, minlength=size).reshape(-1, len(labels))
+    counts = np.bincount(keys, weights=~missing, minlength=size).reshape(-1, len(labels))
+    sums = np.bincount(keys, weights=np.where(missing, 0.0, ages), minlength=size).reshape(-1, len(labels))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+
+    # One row per non-empty (segment, bucket), ordered like
+    # df.groupby("AgeGroup")["Age"].mean().reset_index() within each segment
+    present = rows.ravel() > 0
+    df_grouped = pd.DataFrame({
+        "Segment": np.repeat(np.arange(len(age_arrays)), len(labels))[present],
+        "AgeGroup": np.tile(np.asarray(labels, dtype=object), len(age_arrays))[present],
+        "Age": means.ravel()[present],
+    })
+    return df_grouped.sort_values(["Segment", "AgeGroup"], kind="stable").reset_index(drop=True)
+
+
+def age_group_means(ages: "np.ndarray", edges=AGE_GROUP_EDGES, labels=AGE_GROUP_LABELS) -> "pd.DataFrame":
+    return age_group_means_batch([ages], edges, labels).drop(columns="Segment")
+
+
+def records_json_by_segment(df_grouped: "pd.DataFrame", segments: int) -> list:
+    # df_grouped[["AgeGroup", "Age"]].to_json(orient='records') for every segment,
+    # produced with a single to_json call over the whole batch
+    import numpy as np
+
+    lines = df_grouped[["AgeGroup", "Age"]].to_json(orient="records", lines=True).splitlines()
+    ends = np.cumsum(np.bincount(df_grouped["Segment"], minlength=segments))
+    starts = ends - np.bincount(df_grouped["Segment"], minlength=segments)
+    return ["[" + ",".join(lines[start:end]) + "]" for start, end in zip(starts, ends)]
+
+
+@fabric_function("manipulate_data")
 def manipulate_data(data: dict)-> str:
-    items= data["data"]
-    # Convert the data dictionary to a DataFrame
-    df = pd.DataFrame(items)
-        # Perform basic data manipulation
-    # Example: Add a new column 'AgeGroup' based on the 'Age' column    
-    df['AgeGroup'] = df['Age'].apply(lambda x: 'Adult' if x >= 18 else 'Minor')
-    
-    # Example: Filter rows where 'Age' is greater than 30
-    # df_filtered = df[df["Age"] > 30]
+    # data["data"] holds the rows as records, as a dict of column arrays or as a
+    # base64 Arrow IPC stream. Optional data["edges"]/data["labels"] override the
+    # AgeGroup buckets.
+    with phase("parse"):
+        ages = read_age_column(data["data"])
+    record_metric("rows", len(ages))
 
-    # Example: Group by 'AgeGroup' and calculate the mean age
-    df_grouped = df.groupby("AgeGroup")["Age"].mean().reset_index()
-    resultsJSON = json.dumps({"values": df_grouped.to_json(orient='records')})          
+    # Example: Add an 'AgeGroup' to every row and calculate the mean age per group
+    with phase("compute"):
+        df_grouped = age_group_means(
+            ages, data.get("edges", AGE_GROUP_EDGES), data.get("labels", AGE_GROUP_LABELS)
+        )
+    with phase("serialize"):
+        resultsJSON = json.dumps({"values": df_grouped.to_json(orient='records')})          
     return resultsJSON
 
 
-import numpy as np
-@app.function("transform_data")
+# Min-max normalization for transform_data
+# The matrix is converted once to the requested float dtype and then normalized
+# in place, NORMALIZE_CHUNK_ROWS rows at a time, so no full-size temporaries are
+# created. Constant columns (max == min) normalize to 0 instead of NaN.
+NORMALIZE_CHUNK_ROWS = 65536
+NORMALIZE_DTYPES = ("float32", "float64")
+TRANSFORM_FORMATS = ("text", "npy", "arrow")
+
+
+def normalize_in_place(matrix: "np.ndarray", chunk_rows: int = NORMALIZE_CHUNK_ROWS) -> "np.ndarray":
+    """Scale each column of a 2D float array to [0, 1] in place and return the column means."""
+    import numpy as np
+
+    # Means are taken before normalizing and accumulated in float64 for float32 input
+    column_means = np.mean(matrix, axis=0, dtype=np.float64)
+    min_vals = np.min(matrix, axis=0)
+    ranges = np.max(matrix, axis=0) - min_vals
+    ranges[ranges == 0] = 1
+    scale = (1 / ranges).astype(matrix.dtype)
+    for start in range(0, matrix.shape[0], chunk_rows):
+        block = matrix[start:start + chunk_rows]
+        np.subtract(block, min_vals, out=block)
+        np.multiply(block, scale, out=block)
+    return column_means
+
+
+def encode_matrix(matrix: "np.ndarray", output_format: str) -> str:
+    if output_format == "npy":
+        from io import BytesIO
+
+        import numpy as np
+
+        buffer = BytesIO()
+        np.save(buffer, matrix, allow_pickle=False)
+        return base64.b64encode(buffer.getbuffer()).decode("ascii")
+    if output_format == "arrow":
+        import pyarrow as pa
+
+        # One Arrow column per matrix column, named c0, c1, ...
+        table = pa.table({f"c{i}": matrix[:, i] for i in range(matrix.shape[1])})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii")
+    raise udf.UserDataFunctionInvalidInputError(f"format must be one of {list(TRANSFORM_FORMATS)}.")
+
+
+@fabric_function("transform_data")
 def transform_data(data: dict )-> str:
-    # Extract the items from the input data
-    items = data['data']['items']
+    # Optional data["dtype"] ('float64' or 'float32') and data["format"] ('text',
+    # 'npy' or 'arrow') select the working precision and the response encoding.
+    # 'npy' and 'arrow' return JSON with the base64 matrix and the column means.
+    import numpy as np
+
+    dtype = data.get("dtype", "float64")
+    if dtype not in NORMALIZE_DTYPES:
+        raise udf.UserDataFunctionInvalidInputError("dtype must be 'float64' or 'float32'.")
+    output_format = data.get("format", "text")
+    if output_format not in TRANSFORM_FORMATS:
+        raise udf.UserDataFunctionInvalidInputError(f"format must be one of {list(TRANSFORM_FORMATS)}.")
+
     # Convert the 2D list to a numpy array
-    np_data = np.array(items)
+    with phase("parse"):
+        np_data = np.asarray(data['data']['items'], dtype=dtype)
+    if np_data.ndim != 2:
+        raise udf.UserDataFunctionInvalidInputError("data.items must be a 2D list of numbers.")
+    record_metric("rows", np_data.shape[0])
 
-    # Normalize the data (scale values to range [0, 1])
-    min_vals = np.min(np_data, axis=0)
-    max_vals = np.max(np_data, axis=0)
-    normalized_data = (np_data - min_vals) / (max_vals - min_vals)
+    # Normalize the data (scale values to range [0, 1]) and calculate the mean of each column
+    with phase("compute"):
+        column_means = normalize_in_place(np_data)
 
-    # Calculate the mean of each column
-    column_means = np.mean(np_data, axis=0)
+    with phase("serialize"):
+        if output_format == "text":
+            return f"Normalized Data: {np_data} and Column Means: {column_means}"
+        return json.dumps({
+            "format": output_format,
+            "dtype": np_data.dtype.name,
+            "shape": list(np_data.shape),
+            "data": encode_matrix(np_data, output_format),
+            "columnMeans": column_means.tolist(),
+        })
 
-    return f"Normalized Data: {normalized_data} and Column Means: {column_means}"
 
 
+# Lakehouse uploads
+# Files are serialized into a spooled buffer (memory first, temp disk once it
+# grows past UPLOAD_SPOOL_MAX_MEMORY) instead of a named local file. Buffers up to
+# UPLOAD_CHUNK_SIZE are sent in one call; larger ones are staged as chunks that
+# are appended in parallel at their offsets and committed with one flush.
+UPLOAD_SPOOL_MAX_MEMORY = 64 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_CONCURRENCY = 4
+UPLOAD_FORMATS = {"csv": ".csv", "parquet": ".parquet"}
+
+
+def serialize_dataframe(df: "pd.DataFrame", file_format: str = "csv", compression: str = "snappy"):
+    # Returns a spooled binary buffer positioned at the start and its size in bytes
+    buffer = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+    if file_format == "csv":
+        df.to_csv(buffer, index=False, encoding="utf-8")
+    elif file_format == "parquet":
+        df.to_parquet(buffer, index=False, compression=compression)
+    else:
+        raise udf.UserDataFunctionInvalidInputError(f"fileFormat must be one of {sorted(UPLOAD_FORMATS)}.")
+    size = buffer.tell()
+    buffer.seek(0)
+    return buffer, size
+
+
+def upload_buffer(file_client, buffer, size: int, chunk_size: int = UPLOAD_CHUNK_SIZE,
+                  max_concurrency: int = UPLOAD_MAX_CONCURRENCY):
+    if size <= chunk_size:
+        file_client.upload_data(buffer.read(), length=size, overwrite=True)
+        return
+
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    # At most max_concurrency chunks are read into memory at any time
+    file_client.create_file()
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        pending = set()
+        for offset in range(0, size, chunk_size):
+            if len(pending) >= max_concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            chunk = buffer.read(chunk_size)
+            pending.add(executor.submit(file_client.append_data, chunk, offset=offset, length=len(chunk)))
+        for future in pending:
+            future.result()
+    file_client.flush_data(size)
+
 
 @app.fabric_item_input(argName="mylakehouse", alias="lakehousebronze")
-@app.function("write_csv_file_in_lakehouse")
-def write_csv_file_in_lakehouse(mylakehouse: udf.FabricSqlConnection)-> str:
+@fabric_function("write_csv_file_in_lakehouse")
+def write_csv_file_in_lakehouse(mylakehouse: udf.FabricLakehouseClient, fileFormat: str = "csv",
+                                compression: str = "snappy")-> str:
+    import pandas as pd
+
     data = [(1,"John Smith", 31), (2,"Kayla Jones", 33)]
-    csvFileName = "Employees" + str(round(datetime.datetime.now().timestamp())) + ".csv"
+    if fileFormat not in UPLOAD_FORMATS:
+        raise udf.UserDataFunctionInvalidInputError(f"fileFormat must be one of {sorted(UPLOAD_FORMATS)}.")
+    csvFileName = "Employees" + str(round(datetime.datetime.now().timestamp())) + UPLOAD_FORMATS[fileFormat]
        
     # Convert the data to a DataFrame
     df = pd.DataFrame(data, columns=['ID','EmpName', 'DepID'])
-    # Write the DataFrame to a CSV file
-    df.to_csv(csvFileName, index=False)
+    # Serialize the DataFrame to CSV or Parquet (compression applies to Parquet only)
+    with phase("serialize"):
+        buffer, size = serialize_dataframe(df, fileFormat, compression)
+    record_metric("uploadBytes", size)
        
-    # Upload the CSV file to the Lakehouse
+    # Upload the file to the Lakehouse
     connection = mylakehouse.connectToFiles()
     csvFile = connection.get_file_client(csvFileName)  
-    with open(csvFileName, 'r') as file:
-        csvFile.upload_data(file.read(), overwrite=True)
-
-    csvFile.close()
-    connection.close()
+    try:
+        with buffer, phase("upload"):
+            upload_buffer(csvFile, buffer, size)
+    finally:
+        csvFile.close()
+        connection.close()
     return f"File {csvFileName} was written to the Lakehouse. Open the Lakehouse in https://app.fabric.microsoft.com to view the files"
 
 
     
+# Streaming CSV reads
+# The file is downloaded in ranged chunks and parsed incrementally by the Arrow
+# CSV reader, one record batch at a time. Projection, filters and the row range
+# are applied per batch, and the download stops as soon as maxRows rows have
+# been produced, so memory stays bounded by the chunk and batch sizes.
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+CSV_BLOCK_SIZE = 1024 * 1024
+CSV_FILTER_OPS = {
+    "==": "equal", "!=": "not_equal", "<": "less", "<=": "less_equal", ">": "greater", ">=": "greater_equal",
+}
+
+
+class ChunkStream:
+    """A minimal readable binary file over an iterator of byte chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = memoryview(b"")
+        self.closed = False
+        # The Arrow reader may call read() from its I/O thread; pulling chunks in
+        # the opening context keeps their phases on the current invocation
+        self._context = contextvars.copy_context()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            rest = bytes(self._pending) + b"".join(self._context.run(list, self._chunks))
+            self._pending = memoryview(b"")
+            return rest
+        while not self._pending:
+            chunk = self._context.run(next, self._chunks, None)
+            if chunk is None:
+                return b""
+            self._pending = memoryview(chunk)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return bytes(data)
+
+    def close(self):
+        self.closed = True
+
+
+def download_chunks(file_client, size: int, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+    # Each chunk is one ranged GET, issued only when the parser asks for more bytes
+    for offset in range(0, size, chunk_size):
+        with phase("download"):
+            chunk = file_client.download_file(offset=offset, length=min(chunk_size, size - offset)).readall()
+        record_metric("downloadBytes", len(chunk))
+        yield chunk
+
+
+def check_columns(names, columns=None, filters=None):
+    # Unknown names in columns or filters are a client error, not a KeyError
+    unknown = [c for c in dict.fromkeys(list(columns or []) + [f[0] for f in filters or []]) if c not in names]
+    if unknown:
+        raise udf.UserDataFunctionInvalidInputError(f"Unknown columns {unknown}; the file has {list(names)}.")
+
+
+def filter_operand(column, value):
+    # Columns are read as text unless columnTypes says otherwise. Comparing a
+    # text column with numbers compares the numeric values of its cells; cells
+    # that are not numbers become missing and match no filter.
+    import pyarrow as pa
+
+    values = value if isinstance(value, list) else [value]
+    numeric = values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
+    if pa.types.is_string(column.type) and numeric:
+        import pandas as pd
+
+        return pa.array(pd.to_numeric(column.to_pandas(), errors="coerce"), type=pa.float64(), from_pandas=True)
+    return column
+
+
+def build_filter_mask(batch, filters):
+    # filters is a list of [column, op, value]; op is a comparison or "in"
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    mask = None
+    for column, op, value in filters:
+        operand = filter_operand(batch.column(column), value)
+        if op == "in":
+            condition = pc.is_in(operand, value_set=pa.array(value).cast(operand.type))
+        elif op in CSV_FILTER_OPS:
+            condition = getattr(pc, CSV_FILTER_OPS[op])(operand, value)
+        else:
+            raise udf.UserDataFunctionInvalidInputError(f"Unsupported filter operator '{op}'.")
+        mask = condition if mask is None else pc.and_kleene(mask, condition)
+    return mask
+
+
+def parse_column_types(column_types: dict = None) -> dict:
+    # {"Year": "int64", ...} -> Arrow types, by the names pyarrow.type_for_alias accepts
+    import pyarrow as pa
+
+    types = {}
+    for name, alias in (column_types or {}).items():
+        try:
+            types[name] = pa.type_for_alias(alias)
+        except (TypeError, ValueError):
+            raise udf.UserDataFunctionInvalidInputError(f"Unknown type '{alias}' for column '{name}'.")
+    return types
+
+
+def peek_header(chunks) -> tuple:
+    # Returns (column names, chunks) with the names read from the first record
+    import csv
+    import io
+    import itertools
+
+    chunks = iter(chunks)
+    first = next(chunks, b"")
+    header = next(csv.reader(io.StringIO(first.decode("utf-8-sig", errors="replace"))), [])
+    return header, itertools.chain([first], chunks)
+
+
+def open_csv(chunks, include_columns=None, column_types: dict = None, block_size: int = CSV_BLOCK_SIZE):
+    # Every column is read as text unless column_types (name -> Arrow type) says
+    # otherwise: type inference only sees the first block, so a column such as
+    # ISBN or Year that turns non-numeric further down would fail the read
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    names, chunks = peek_header(chunks)
+    check_columns(names, include_columns)
+    types = {name: pa.string() for name in names}
+    types.update(column_types or {})
+    return pa_csv.open_csv(
+        ChunkStream(chunks),
+        # Parse on the calling thread: read-ahead threads would call back into the
+        # Python chunk stream and could outlive an early exit
+        read_options=pa_csv.ReadOptions(block_size=block_size, use_threads=False),
+        # Empty fields are missing values, as in pandas.read_csv
+        convert_options=pa_csv.ConvertOptions(
+            column_types=types, include_columns=include_columns, strings_can_be_null=True, timestamp_parsers=[]
+        ),
+    )
+
+
+def select_rows(batches, columns=None, filters=None, skip_rows: int = 0, max_rows: int = None):
+    remaining = max_rows
+    checked = False
+    for batch in batches:
+        if not checked:
+            check_columns(batch.schema.names, columns, filters)
+            checked = True
+        if filters:
+            mask = build_filter_mask(batch, filters)
+            batch = batch.filter(mask, null_selection_behavior="drop")
+        if skip_rows:
+            skipped = min(skip_rows, batch.num_rows)
+            batch, skip_rows = batch.slice(skipped), skip_rows - skipped
+        if remaining is not None:
+            batch = batch.slice(0, remaining)
+            remaining -= batch.num_rows
+        if columns:
+            batch = batch.select(list(columns))
+        if batch.num_rows:
+            yield batch
+        if remaining == 0:
+            return
+
+
+def iter_csv_batches(chunks, columns=None, filters=None, skip_rows: int = 0, max_rows: int = None,
+                     column_types: dict = None, block_size: int = CSV_BLOCK_SIZE):
+    include = None
+    if columns:
+        include = list(dict.fromkeys(list(columns) + [f[0] for f in filters or []]))
+    reader = open_csv(chunks, include, column_types, block_size)
+    try:
+        yield from select_rows(reader, columns, filters, skip_rows, max_rows)
+    finally:
+        # Stops the download on early exit
+        reader.close()
+
+
+def format_rows(batch) -> str:
+    # "[v1,v2,...]" per row, built column-wise instead of row by row. Text
+    # columns are printed as they appear in the file and missing values as nan.
+    with phase("serialize"):
+        record_metric("rows", batch.num_rows)
+        df = batch.to_pandas()
+        if df.shape[1] == 0:
+            return "[]" * len(df)
+        text = [series.astype(str).mask(series.isna(), "nan") for _, series in df.items()]
+        rows = text[0].str.cat(text[1:], sep=",") if len(text) > 1 else text[0]
+        return "".join(("[" + rows + "]").tolist())
+
+
+# Cache of parsed lakehouse files
+# Parsed Arrow tables are kept per file path and revalidated on every call
+# against the file's ETag and last-modified time, so an unchanged file costs one
+# get_file_properties round trip instead of a download and parse. Entries expire
+# after LAKEHOUSE_CACHE_TTL seconds and the least recently used ones are evicted
+# once the cached tables exceed LAKEHOUSE_CACHE_MAX_BYTES. A full read that
+# misses the cache keeps the batches it streams and caches them as one table at
+# the end, unless they outgrow the budget on the way. Reads with maxRows are
+# streamed without caching so that they still stop downloading early.
+LAKEHOUSE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+LAKEHOUSE_CACHE_TTL = 3600
+
+
+class LakehouseFileCache:
+    """A size-bounded LRU of parsed tables validated by file version."""
+
+    def __init__(self, max_bytes=LAKEHOUSE_CACHE_MAX_BYTES, ttl=LAKEHOUSE_CACHE_TTL):
+        from collections import OrderedDict
+
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, table, nbytes, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def _drop(self, key):
+        _, _, nbytes, _ = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] != version or entry[3] < time.monotonic()):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, table):
+        nbytes = table.nbytes
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, table, nbytes, time.monotonic() + self.ttl)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries), "bytes": self._bytes, "maxBytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            }
+
+
+lakehouse_file_cache = LakehouseFileCache()
+
+
+def read_lakehouse_csv(file_client, cache_key: str, columns=None, filters=None, skip_rows: int = 0,
+                       max_rows: int = None, column_types: dict = None,
+                       cache: LakehouseFileCache = lakehouse_file_cache):
+    # Yields the selected record batches, from the cache when the file is unchanged
+    with phase("metadata"):
+        properties = file_client.get_file_properties()
+    version = (properties.etag, properties.last_modified)
+    if column_types:
+        cache_key += "?" + json.dumps({name: str(t) for name, t in column_types.items()}, sort_keys=True)
+    table = cache.get(cache_key, version)
+    record_metric("cacheHits", table is not None)
+    if table is not None:
+        return select_rows(table.to_batches(max_chunksize=65536), columns, filters, skip_rows, max_rows)
+    chunks = download_chunks(file_client, properties.size)
+    if max_rows is not None or properties.size > cache.max_bytes:
+        return iter_csv_batches(chunks, columns, filters, skip_rows, max_rows, column_types)
+    return select_rows(read_and_cache(chunks, cache, cache_key, version, column_types), columns, filters, skip_rows)
+
+
+def read_and_cache(chunks, cache: LakehouseFileCache, key: str, version, column_types: dict = None):
+    # Yields every parsed batch and caches them as one table once the file has
+    # been read to the end; batches stop being kept when they exceed the budget
+    import pyarrow as pa
+
+    reader = open_csv(chunks, column_types=column_types)
+    kept, nbytes = [], 0
+    try:
+        for batch in reader:
+            if kept is not None:
+                nbytes += batch.nbytes
+                if nbytes <= cache.max_bytes:
+                    kept.append(batch)
+                else:
+                    kept = None
+            yield batch
+    finally:
+        reader.close()
+    if kept is not None:
+        cache.put(key, version, pa.Table.from_batches(kept, schema=reader.schema))
+
+
 @app.fabric_item_input(argName="myLakehouse", alias="lakehousebronze")
-@app.function("read_csv_from_lakehouse")
-def read_csv_from_lakehouse(myLakehouse: udf.FabricLakehouseClient, csvFileName: str) -> str:
+@fabric_function("read_csv_from_lakehouse")
+def read_csv_from_lakehouse(myLakehouse: udf.FabricLakehouseClient, csvFileName: str, columns: list = None,
+                            filters: list = None, skipRows: int = 0, maxRows: int = None,
+                            columnTypes: dict = None) -> str:
+    # columns projects the output, filters keeps rows matching every [column, op, value]
+    # (op is one of ==, !=, <, <=, >, >=, in) and skipRows/maxRows select a range of
+    # the matching rows. Columns are read as text; columnTypes maps column names to
+    # Arrow types (e.g. {"Year": "int64"}) for the ones that should be parsed.
+    column_types = parse_column_types(columnTypes)
 
     # Connect to the Lakehouse
     connection = myLakehouse.connectToFiles()   
-
-    # Download the CSV file from the Lakehouse
     csvFile = connection.get_file_client(csvFileName)
-    downloadFile=csvFile.download_file()
-    csvData = downloadFile.readall()
-    
-    # Read the CSV data into a pandas DataFrame
-    from io import StringIO
-    df = pd.read_csv(StringIO(csvData.decode('utf-8')))
-
-    # Display the DataFrame    
-    result="" 
-    for index, row in df.iterrows():
-        result=result + "["+ (",".join([str(item) for item in row]))+"]"
-    
-    # Close the connection
-    csvFile.close()
-    connection.close()
+    try:
+        # Read the CSV file (from the cache when unchanged) and format it one batch at a time
+        batches = read_lakehouse_csv(csvFile, f"lakehousebronze/{csvFileName}", columns, filters, skipRows, maxRows,
+                                     column_types)
+        with phase("parse"):
+            result = "".join(format_rows(batch) for batch in batches)
+    finally:
+        # Close the connection
+        csvFile.close()
+        connection.close()
 
     return f"CSV file read successfully.{result}"
+
+
+# Online recommendations
+# recommend_books answers top-N requests from the ALS factors that the notebook
+# exports as .npy files under RECOMMENDATION_EXPORT_DIR. The files are
+# downloaded once per worker and memory-mapped; the export's manifest.json is
+# rechecked at most every RECOMMENDATION_CHECK_INTERVAL seconds and a changed
+# ETag loads the new export. A request is one matrix product of the requested
+# users' factors with the item factors, with already-rated items masked out.
+RECOMMENDATION_EXPORT_DIR = "book-recommendation/serving/als"
+RECOMMENDATION_FILES = ("user_keys", "user_factors", "item_keys", "item_factors", "rated_offsets", "rated_items")
+RECOMMENDATION_CHECK_INTERVAL = 60
+RECOMMENDATION_MAX_TOP_N = 100
+RECOMMENDATION_MAX_USERS = 1000
+
+
+class FactorStore:
+    """Memory-mapped ALS factors, ID mappings and rated items of one export."""
+
+    def __init__(self, directory: str, version):
+        import numpy as np
+
+        self.directory = directory
+        self.version = version
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in RECOMMENDATION_FILES}
+        # user_keys is sorted, so a user's factor row is found by binary search
+        self.user_keys = arrays["user_keys"]
+        self.user_factors = arrays["user_factors"]
+        self.item_keys = arrays["item_keys"]
+        self.item_factors = arrays["item_factors"]
+        # Items rated by user row r are rated_items[rated_offsets[r]:rated_offsets[r + 1]]
+        self.rated_offsets = arrays["rated_offsets"]
+        self.rated_items = arrays["rated_items"]
+
+    def user_key_array(self, user_ids: list) -> tuple:
+        # Returns (keys, valid): user_ids in the dtype of user_keys without any
+        # truncation, and False where an ID is out of the key range (so unknown)
+        import numpy as np
+
+        dtype = self.user_keys.dtype
+        invalid = udf.UserDataFunctionInvalidInputError("userIds must match the type of the exported user IDs.")
+        if dtype.kind in "iu":
+            info, values = np.iinfo(dtype), []
+            for user_id in user_ids:
+                if isinstance(user_id, bool):
+                    raise invalid
+                if isinstance(user_id, float) and user_id.is_integer():
+                    user_id = int(user_id)
+                elif isinstance(user_id, str):
+                    try:
+                        user_id = int(user_id)
+                    except ValueError:
+                        raise invalid
+                if not isinstance(user_id, int):
+                    raise invalid
+                values.append(user_id)
+            valid = np.array([info.min <= v <= info.max for v in values], dtype=bool)
+            keys = np.array([v if ok else 0 for v, ok in zip(values, valid)], dtype=dtype)
+            return keys, valid
+        if dtype.kind == "U":
+            width = dtype.itemsize // 4
+            if not all(isinstance(user_id, str) for user_id in user_ids):
+                raise invalid
+            if any(len(user_id) > width for user_id in user_ids):
+                raise udf.UserDataFunctionInvalidInputError(f"userIds can be at most {width} characters long.")
+            return np.array(user_ids, dtype=dtype), np.ones(len(user_ids), dtype=bool)
+        try:
+            return np.asarray(user_ids).astype(dtype), np.ones(len(user_ids), dtype=bool)
+        except ValueError:
+            raise invalid
+
+    def find_users(self, user_ids: list) -> "np.ndarray":
+        # Factor row of each user ID, or -1 for users the model does not know
+        import numpy as np
+
+        keys, valid = self.user_key_array(user_ids)
+        if len(self.user_keys) == 0:
+            return np.full(len(keys), -1)
+        rows = np.minimum(np.searchsorted(self.user_keys, keys), len(self.user_keys) - 1)
+        return np.where(valid & (self.user_keys[rows] == keys), rows, -1)
+
+    def recommend(self, user_ids: list, top_n: int) -> list:
+        import numpy as np
+
+        rows = self.find_users(user_ids)
+        known = rows[rows >= 0]
+        with phase("compute"):
+            scores = np.asarray(self.user_factors[known]) @ self.item_factors.T
+            for i, row in enumerate(known):
+                scores[i, self.rated_items[self.rated_offsets[row]:self.rated_offsets[row + 1]]] = -np.inf
+            n = min(top_n, scores.shape[1])
+            top = np.argpartition(scores, -n, axis=1)[:, -n:]
+            order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+
+        with phase("serialize"):
+            record_metric("users", len(rows))
+            results, position = [], 0
+            for user_id, row in zip(user_ids, rows):
+                if row < 0:
+                    results.append({"userId": user_id, "known": False, "recommendations": []})
+                    continue
+                items, item_scores = top[position], top_scores[position]
+                position += 1
+                results.append({
+                    "userId": user_id,
+                    "known": True,
+                    "recommendations": [
+                        {"itemId": self.item_keys[item].item(), "score": float(score)}
+                        for item, score in zip(items, item_scores) if score != -np.inf
+                    ],
+                })
+            return results
+
+
+_lakehouse_exports = {}  # version file path -> [loaded export, monotonic time of the last check]
+_lakehouse_refresh_locks = {}  # version file path -> lock held by the call that refreshes it
+_lakehouse_exports_lock = threading.Lock()
+
+
+def download_file_to(file_client, path: str, size: int):
+    with open(path, "wb") as file:
+        for chunk in download_chunks(file_client, size):
+            file.write(chunk)
+
+
+def get_lakehouse_export(connection, version_path: str, paths: list, load,
+                         check_interval: float = RECOMMENDATION_CHECK_INTERVAL):
+    # Downloads the lakehouse files in paths into a local directory named by the
+    # ETag of version_path and returns load(local_dir, version). The result is
+    # reused until a check finds a new ETag; it must have directory and version.
+    # A replaced export is not closed, since requests that got it earlier may
+    # still be using it: its memory maps or connections are released when it
+    # is garbage-collected, and on POSIX its removed files stay readable until
+    # then. One call at a time checks and refreshes an export; meanwhile the
+    # other calls keep getting the loaded version, and only calls that have no
+    # version to fall back on wait for the refresh.
+    with _lakehouse_exports_lock:
+        entry = _lakehouse_exports.get(version_path)
+        if entry is not None and time.monotonic() - entry[1] < check_interval:
+            return entry[0]
+        refresh_lock = _lakehouse_refresh_locks.setdefault(version_path, threading.Lock())
+    if not refresh_lock.acquire(blocking=entry is None):
+        return entry[0]
+    try:
+        with _lakehouse_exports_lock:
+            entry = _lakehouse_exports.get(version_path)
+        if entry is not None and time.monotonic() - entry[1] < check_interval:
+            return entry[0]  # refreshed by the call this one waited for
+        try:
+            return refresh_lakehouse_export(connection, version_path, paths, load, entry)
+        except Exception:
+            if entry is None:
+                raise
+            # Keep serving the loaded version and try again after check_interval
+            logging.warning(f"Refreshing {version_path} failed; serving version {entry[0].version}.", exc_info=True)
+            with _lakehouse_exports_lock:
+                entry[1] = time.monotonic()
+            return entry[0]
+    finally:
+        refresh_lock.release()
+
+
+def refresh_lakehouse_export(connection, version_path: str, paths: list, load, entry):
+    now = time.monotonic()
+    version_file = connection.get_file_client(version_path)
+    try:
+        with phase("metadata"):
+            version = version_file.get_file_properties().etag
+    finally:
+        version_file.close()
+    if entry is not None and entry[0].version == version:
+        with _lakehouse_exports_lock:
+            entry[1] = now
+        return entry[0]
+
+    # Each version gets its own local directory, filled under a temporary
+    # name and renamed into place, so files that another worker process has
+    # memory-mapped or opened are never overwritten
+    parent = os.path.join(tempfile.gettempdir(), "fabric-exports")
+    local_dir = os.path.join(parent, re.sub(r"\W", "_", version_path) + "-" + re.sub(r"\W", "", version))
+    if not os.path.isdir(local_dir):
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent)
+        try:
+            for path in paths:
+                file_client = connection.get_file_client(path)
+                try:
+                    with phase("metadata"):
+                        size = file_client.get_file_properties().size
+                    download_file_to(file_client, os.path.join(staging, os.path.basename(path)), size)
+                finally:
+                    file_client.close()
+            os.rename(staging, local_dir)
+        except OSError:
+            if not os.path.isdir(local_dir):
+                raise
+            # Another worker finished the same download first
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    try:
+        export = load(local_dir, version)
+    except Exception:
+        # Files that cannot be loaded (e.g. downloaded while the notebook was
+        # rewriting them) must not be reused by the next attempt
+        shutil.rmtree(local_dir, ignore_errors=True)
+        raise
+    with _lakehouse_exports_lock:
+        _lakehouse_exports[version_path] = [export, now]
+    if entry is not None and entry[0].directory != local_dir:
+        shutil.rmtree(entry[0].directory, ignore_errors=True)
+    return export
+
+
+def get_factor_store(connection, directory: str = RECOMMENDATION_EXPORT_DIR) -> FactorStore:
+    paths = [f"{directory}/{name}.npy" for name in RECOMMENDATION_FILES]
+    return get_lakehouse_export(connection, f"{directory}/manifest.json", paths, FactorStore)
+
+
+@app.fabric_item_input(argName="myLakehouse", alias="lakehousebronze")
+@fabric_function("recommend_books")
+def recommend_books(myLakehouse: udf.FabricLakehouseClient, userIds: list, topN: int = 10) -> list:
+    # Returns [{"userId", "known", "recommendations": [{"itemId", "score"}, ...]}] in
+    # the order of userIds, best first, without items the user has already rated.
+    if not 1 <= topN <= RECOMMENDATION_MAX_TOP_N:
+        raise udf.UserDataFunctionInvalidInputError(f"topN must be between 1 and {RECOMMENDATION_MAX_TOP_N}.")
+    if len(userIds) > RECOMMENDATION_MAX_USERS:
+        raise udf.UserDataFunctionInvalidInputError(f"At most {RECOMMENDATION_MAX_USERS} userIds can be requested.")
+
+    connection = myLakehouse.connectToFiles()
+    try:
+        store = get_factor_store(connection)
+    finally:
+        connection.close()
+    return store.recommend(userIds, topN)
+
+
+# Precomputed recommendation store
+# The notebook also publishes each user's batch recommendations as one packed
+# record in a SQLite file: recommendations(user_id PRIMARY KEY, items BLOB),
+# where items holds n little-endian int32 item indexes followed by their n
+# float32 scores, and items(item_index PRIMARY KEY, item_id, title). The file is
+# loaded like the factor export and each loaded version keeps its own LRU of
+# decoded lookups, bounded by their estimated size, so repeated users cost no
+# query at all. A replaced version, its connection and its LRU are freed once the
+# last request that holds it is done.
+RECOMMENDATION_STORE_PATH = "book-recommendation/serving/recommendations.sqlite"
+RECOMMENDATION_STORE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+class RecommendationCache:
+    """A size-bounded LRU of decoded recommendation lists."""
+
+    def __init__(self, max_bytes=RECOMMENDATION_STORE_CACHE_MAX_BYTES):
+        from collections import OrderedDict
+
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # user_id -> (recommendations, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    @staticmethod
+    def estimate_size(recommendations) -> int:
+        # An {"itemId", "title", "score"} dict with a short item ID and a float
+        # takes about 330 bytes plus the characters of its title
+        if recommendations is None:
+            return 16
+        return 56 + sum(330 + len(item["title"] or "") for item in recommendations)
+
+    def get(self, user_id, compute):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        recommendations = compute(user_id)
+        nbytes = self.estimate_size(recommendations)
+        if nbytes > self.max_bytes:
+            return recommendations
+        with self._lock:
+            if user_id not in self._entries:
+                self._entries[user_id] = (recommendations, nbytes)
+                self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self._bytes -= dropped
+                self.evictions += 1
+        return recommendations
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries), "bytes": self._bytes, "maxBytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+            }
+
+
+class RecommendationStore:
+    """Read-only keyed store of precomputed recommendations."""
+
+    def __init__(self, directory: str, version):
+        import sqlite3
+
+        self.directory = directory
+        self.version = version
+        path = os.path.join(directory, os.path.basename(RECOMMENDATION_STORE_PATH))
+        self._connection = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.cache = RecommendationCache()
+
+    def lookup(self, user_id):
+        # [{"itemId", "title", "score"}, ...] best first, or None for an unknown user
+        with phase("execute"), self._lock:
+            row = self._connection.execute(
+                "SELECT items FROM recommendations WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            count = len(row[0]) // 8
+            values = struct.unpack(f"<{count}i{count}f", row[0])
+            indexes, scores = values[:count], values[count:]
+            items = {
+                item_index: (item_id, title)
+                for item_index, item_id, title in self._connection.execute(
+                    f"SELECT item_index, item_id, title FROM items WHERE item_index IN ({','.join('?' * count)})",
+                    indexes,
+                )
+            }
+        return [
+            {"itemId": items[i][0], "title": items[i][1], "score": score}
+            for i, score in zip(indexes, scores) if i in items
+        ]
+
+    def cached_lookup(self, user_id):
+        return self.cache.get(user_id, self.lookup)
+
+
+def get_recommendation_store(connection, path: str = RECOMMENDATION_STORE_PATH) -> RecommendationStore:
+    return get_lakehouse_export(connection, path, [path], RecommendationStore)
+
+
+def recommendation_cache_stats(path: str = RECOMMENDATION_STORE_PATH):
+    # LRU state of the loaded store version, or None before the first lookup
+    entry = _lakehouse_exports.get(path)
+    return entry[0].cache.stats() if entry is not None else None
+
+
+@app.fabric_item_input(argName="myLakehouse", alias="lakehousebronze")
+@fabric_function("get_user_recommendations")
+def get_user_recommendations(myLakehouse: udf.FabricLakehouseClient, userIds: list) -> list:
+    # Returns [{"userId", "known", "recommendations": [{"itemId", "title", "score"}, ...]}]
+    # from the notebook's last batch run, in the order of userIds.
+    if len(userIds) > RECOMMENDATION_MAX_USERS:
+        raise udf.UserDataFunctionInvalidInputError(f"At most {RECOMMENDATION_MAX_USERS} userIds can be requested.")
+    if not all(isinstance(user_id, (int, str)) for user_id in userIds):
+        raise udf.UserDataFunctionInvalidInputError("userIds must be integers or strings.")
+
+    connection = myLakehouse.connectToFiles()
+    try:
+        store = get_recommendation_store(connection)
+    finally:
+        connection.close()
+    results = []
+    for user_id in userIds:
+        recommendations = store.cached_lookup(user_id)
+        results.append({
+            "userId": user_id, "known": recommendations is not None, "recommendations": recommendations or [],
+        })
+    record_metric("users", len(userIds))
+    return results
+
+
+# Batch invocation
+# invoke_batch runs one registered function over many payloads in a single
+# request. Each payload holds the function's keyword arguments and gets its own
+# result or error. Functions listed in batch_functions process the whole batch
+# at once (manipulate_data concatenates every Age column and aggregates them in
+# one pass); the others are called once per payload. Functions that take Fabric
+# items cannot be batched because the items are bound per request.
+BATCH_MAX_ITEMS = 1000
+
+
+def batch_error(error: Exception) -> dict:
+    return {"error": {"type": type(error).__name__, "message": str(error)}}
+
+
+def check_payload(func, payload):
+    # Raises the TypeError that func(**payload) would raise for a payload that
+    # does not fit func's signature, so vectorized batches report the same errors
+    import inspect
+
+    name = func.__qualname__
+    if not isinstance(payload, dict):
+        raise TypeError(f"{func.__module__}.{name}() argument after ** must be a mapping, not {type(payload).__name__}")
+    parameters = inspect.signature(func).parameters
+    for key in payload:
+        if key not in parameters:
+            raise TypeError(f"{name}() got an unexpected keyword argument '{key}'")
+    missing = [f"'{p.name}'" for p in parameters.values() if p.default is p.empty and p.name not in payload]
+    if missing:
+        names = missing[0] if len(missing) == 1 else (
+            f"{missing[0]} and {missing[1]}" if len(missing) == 2 else f"{', '.join(missing[:-1])}, and {missing[-1]}"
+        )
+        plural = "s" if len(missing) > 1 else ""
+        raise TypeError(f"{name}() missing {len(missing)} required positional argument{plural}: {names}")
+
+
+def manipulate_data_batch(payloads: list) -> list:
+    results = [None] * len(payloads)
+    groups = {}  # (edges, labels) -> [(index, ages)]
+    for index, payload in enumerate(payloads):
+        try:
+            data = payload["data"]
+            ages = read_age_column(data["data"])
+            key = (tuple(data.get("edges", AGE_GROUP_EDGES)), tuple(data.get("labels", AGE_GROUP_LABELS)))
+            groups.setdefault(key, []).append((index, ages))
+        except Exception as error:
+            results[index] = batch_error(error)
+
+    for (edges, labels), members in groups.items():
+        try:
+            df_grouped = age_group_means_batch([ages for _, ages in members], list(edges), list(labels))
+        except Exception as error:
+            for index, _ in members:
+                results[index] = batch_error(error)
+            continue
+        for (index, _), values in zip(members, records_json_by_segment(df_grouped, len(members))):
+            results[index] = {"result": json.dumps({"values": values})}
+    return results
+
+
+batch_functions = {"manipulate_data": manipulate_data_batch}
+BATCHABLE_FUNCTIONS = ("hello_fabric", "manipulate_data", "transform_data")
+
+
+def run_batch(function_name: str, payloads: list) -> list:
+    if function_name not in BATCHABLE_FUNCTIONS:
+        raise udf.UserDataFunctionInvalidInputError(
+            f"functionName must be one of {list(BATCHABLE_FUNCTIONS)}."
+        )
+    if len(payloads) > BATCH_MAX_ITEMS:
+        raise udf.UserDataFunctionInvalidInputError(f"A batch can hold at most {BATCH_MAX_ITEMS} payloads.")
+    func = functions[function_name]
+    if function_name in batch_functions:
+        results, valid = [None] * len(payloads), []
+        for index, payload in enumerate(payloads):
+            try:
+                check_payload(func, payload)
+                valid.append(index)
+            except TypeError as error:
+                results[index] = batch_error(error)
+        batch_results = batch_functions[function_name]([payloads[index] for index in valid])
+        for index, result in zip(valid, batch_results):
+            results[index] = result
+        return results
+
+    results = []
+    for payload in payloads:
+        try:
+            results.append({"result": func(**payload)})
+        except Exception as error:
+            results.append(batch_error(error))
+    return results
+
+
+@fabric_function("invoke_batch")
+def invoke_batch(functionName: str, payloads: list) -> list:
+    # payloads is a list of keyword-argument dicts, e.g. [{"name": "Ana"}, {"name": "Bo"}]
+    # for hello_fabric. Returns [{"result": ...} | {"error": {"type", "message"}}] in order.
+    return run_batch(functionName, payloads)
+
+
+@fabric_function("get_diagnostics")
+def get_diagnostics() -> dict:
+    # Rolling latency percentiles per function and phase, plus pool and cache state
+    return {
+        "functions": {name: stats.snapshot() for name, stats in function_stats.items()},
+        "sqlPools": {alias: pool.stats() for alias, pool in list(_sql_pools.items())},
+        "lakehouseCache": lakehouse_file_cache.stats(),
+        "lakehouseExports": {path: entry[0].version for path, entry in list(_lakehouse_exports.items())},
+        "recommendationCache": recommendation_cache_stats(),
+        "peakRssMb": peak_rss_mb(),
+    }
+
+
+# Warm-up
+# Imports the heavy dependencies on a background thread right after the worker
+# loads this module, so they are usually ready before the first request that
+# needs them. Set PRELOAD_HEAVY_MODULES=0 in the environment to turn it off.
+HEAVY_MODULES = ("numpy", "pandas", "pyarrow", "pyarrow.csv", "pyarrow.compute")
+PRELOAD_HEAVY_MODULES = os.environ.get("PRELOAD_HEAVY_MODULES", "1") == "1"
+
+
+def warm_up(modules=HEAVY_MODULES) -> threading.Thread:
+    def preload():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                logging.info(f"Warm-up skipped {name}, which is not installed.")
+
+    thread = threading.Thread(target=preload, name="function-app-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+if PRELOAD_HEAVY_MODULES:
+    warm_up()
@@ -0,0 +1,54 @@
+"""Throughput of invoke_batch against one call per payload.
+
+Each single call and each batch pays --request-overhead-ms once, modelling the
+HTTP round trip and request handling that a batch amortizes.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from common import load_function_app
+
+
+def items_per_second(fn, items, request_overhead_ms, requests):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start + requests * request_overhead_ms / 1000
+    return items / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--records-per-item", type=int, default=100)
+    parser.add_argument("--request-overhead-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    function_app = load_function_app()
+    functions = function_app.functions
+    rng = np.random.default_rng(0)
+    for size in args.batch_sizes:
+        payloads = {
+            "hello_fabric": [{"name": f"User {i}"} for i in range(size)],
+            "manipulate_data": [
+                {"data": {"data": [{"Age": int(a)} for a in rng.integers(1, 90, args.records_per_item)]}}
+                for _ in range(size)
+            ],
+            "transform_data": [
+                {"data": {"data": {"items": rng.random((args.records_per_item, 4)).tolist()}}}
+                for _ in range(size)
+            ],
+        }
+        for name, batch in payloads.items():
+            functions[name](**batch[0])  # import dependencies before timing
+            single = items_per_second(
+                lambda: [functions[name](**payload) for payload in batch], size, args.request_overhead_ms, size)
+            batched = items_per_second(
+                lambda: functions["invoke_batch"](name, batch), size, args.request_overhead_ms, 1)
+            print(f"batch={size:>5}  {name:<16} single {single:10.0f} items/s  batch {batched:10.0f} items/s"
+                  f"  ({batched / single:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Cold-start cost of function_app: import time and time to first response.
+
+Every measurement runs in a fresh interpreter, which imports function_app and
+then calls one registered function twice (first and warm response). It is run
+with the background warm-up on and off (PRELOAD_HEAVY_MODULES=1/0); with it
+on, --delay-ms models the idle time between worker start and first request.
+Lakehouse functions use the local lakehouse stand-in.
+"""
+import argparse
+import csv
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SAMPLE_CALLS = {
+    "hello_fabric": lambda env: ("Fabric",),
+    "manipulate_data": lambda env: ({"data": [{"Name": "John", "Age": 31}, {"Name": "Kayla", "Age": 12}]},),
+    "transform_data": lambda env: ({"data": {"items": [[1, 2, 3], [4, 5, 6], [7, 8, 10]]}},),
+    "write_csv_file_in_lakehouse": lambda env: (env["lakehouse"],),
+    "read_csv_from_lakehouse": lambda env: (env["lakehouse"], "employees.csv"),
+}
+
+
+def child(name, delay_ms):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from local_lakehouse import LocalLakehouseClient
+
+    # Set up the stand-in with the standard library only, before timing anything
+    root = tempfile.mkdtemp()
+    with open(os.path.join(root, "employees.csv"), "w", newline="") as file:
+        csv.writer(file).writerows([["ID", "EmpName", "DepID"], [1, "John Smith", 31], [2, "Kayla Jones", 33]])
+    env = {"lakehouse": LocalLakehouseClient(root)}
+    os.chdir(root)
+
+    from common import load_function_app
+
+    start = time.perf_counter()
+    function_app = load_function_app()
+    imported = time.perf_counter()
+    time.sleep(delay_ms / 1000)
+    args = SAMPLE_CALLS[name](env)
+    call_start = time.perf_counter()
+    function_app.functions[name](*args)
+    first = time.perf_counter()
+    function_app.functions[name](*args)
+    warm = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (imported - start) * 1000,
+        "first_ms": (first - call_start) * 1000,
+        "warm_ms": (warm - first) * 1000,
+    }))
+
+
+def run_child(name, preload, delay_ms):
+    env = dict(os.environ, PRELOAD_HEAVY_MODULES="1" if preload else "0")
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", name, "--delay-ms", str(delay_ms)],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--child")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--delay-ms", type=float, default=1000.0)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.delay_ms)
+        return
+
+    print(f"{'function':<30}{'warm-up':<9}{'import ms':>10}{'first ms':>10}{'warm ms':>10}")
+    for name in SAMPLE_CALLS:
+        for preload in (False, True):
+            runs = [run_child(name, preload, args.delay_ms) for _ in range(args.repeat)]
+            median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+            print(f"{name:<30}{'on' if preload else 'off':<9}"
+                  f"{median['import_ms']:>10.1f}{median['first_ms']:>10.1f}{median['warm_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
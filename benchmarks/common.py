@@ -0,0 +1,66 @@
+"""Shared helpers for the local benchmarks of Function1.UserDataFunction.
+
+The benchmarks import ``function_app`` directly, so they need the same packages
+as the functions themselves (``fabric-user-data-functions``, pandas, numpy and,
+for the Arrow paths, pyarrow). Run them from the repository root, e.g.
+``python benchmarks/sql_pool_benchmark.py``. Benchmarks of notebook helpers
+load the helper's cell with ``load_notebook_cell`` instead.
+"""
+import ast
+import importlib
+import statistics
+import sys
+import time
+from pathlib import Path
+
+FUNCTION_APP_DIR = Path(__file__).resolve().parents[1] / "Function1.UserDataFunction"
+NOTEBOOK_SOURCE = Path(__file__).resolve().parents[1] / "Notebook1.Notebook" / "notebook-content.py"
+
+
+def load_function_app():
+    if str(FUNCTION_APP_DIR) not in sys.path:
+        sys.path.insert(0, str(FUNCTION_APP_DIR))
+    return importlib.import_module("function_app")
+
+
+def load_notebook_cell(function_name, namespace=None):
+    """
+    Run the definitions of the notebook cell that defines function_name.
+
+    Only the cell's imports, functions, classes and UPPER_CASE constants are
+    run, not the statements that use them (e.g. the download of the dataset),
+    so the notebook's Spark session and lakehouse are not needed. Returns the
+    namespace, where constants can be overridden before calling the functions.
+    """
+    source = NOTEBOOK_SOURCE.read_text(encoding="utf-8")
+    cells = source.split("# CELL ********************")
+    cell = next(c for c in cells if f"def {function_name}(" in c)
+    tree = ast.parse(cell.split("# MARKDOWN ********************")[0])
+    # Keep tracebacks pointing at the notebook's own line numbers
+    ast.increment_lineno(tree, source[:source.index(cell)].count("\n"))
+    definitions = [
+        node for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef, ast.ClassDef))
+        or (isinstance(node, ast.Assign) and all(isinstance(t, ast.Name) and t.id.isupper() for t in node.targets))
+    ]
+    namespace = {} if namespace is None else namespace
+    exec(compile(ast.Module(body=definitions, type_ignores=[]), str(NOTEBOOK_SOURCE), "exec"), namespace)
+    return namespace
+
+
+def measure(fn, repeat=50, warmup=3):
+    """Call fn repeatedly and return the per-call latencies in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(label, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<40} p50={statistics.median(timings):9.3f} ms  p95={p95:9.3f} ms  n={len(timings)}")
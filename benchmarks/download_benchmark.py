@@ -0,0 +1,95 @@
+"""Throughput and recovery of the notebook's dataset downloader.
+
+Loads ``download_file`` and ``download_files`` from the notebook's download
+cell and runs them against a local HTTP server stand-in that throttles each
+connection, so downloading the files one at a time is compared with the
+concurrent downloader. The recovery checks then cut the first response of
+every file halfway and confirm that each download resumes with a Range request
+and transfers each byte once, that a server ignoring Range headers still yields
+intact files, and that a checksum mismatch fails the download instead of
+leaving a corrupt file in place.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from common import load_notebook_cell
+from local_http_server import serve
+
+FILES = ["Books.csv", "Ratings.csv", "Users.csv"]
+
+
+def write_files(root, size_mb):
+    rng = np.random.default_rng(0)
+    for name in FILES:
+        with open(os.path.join(root, name), "wb") as file:
+            file.write(rng.bytes(int(size_mb * 2**20)))
+
+
+def same_files(source, target):
+    def digest(path):
+        with open(path, "rb") as file:
+            return hashlib.md5(file.read()).hexdigest()
+
+    return all(digest(os.path.join(source, n)) == digest(os.path.join(target, n)) for n in FILES)
+
+
+def timed_download(notebook, url, source, workers):
+    notebook["DOWNLOAD_WORKERS"] = workers
+    with tempfile.TemporaryDirectory() as target:
+        start = time.perf_counter()
+        notebook["download_files"](url, FILES, target)
+        elapsed = time.perf_counter() - start
+        assert same_files(source, target)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=8.0, help="size of each file")
+    parser.add_argument("--mb-per-second", type=float, default=16.0, help="throttle per connection")
+    args = parser.parse_args()
+
+    notebook = load_notebook_cell("download_file")
+    total_mb = args.size_mb * len(FILES)
+    with tempfile.TemporaryDirectory() as source:
+        write_files(source, args.size_mb)
+
+        print(f"files={len(FILES)} x {args.size_mb} MiB, {args.mb_per_second} MiB/s per connection")
+        with serve(source, bytes_per_second=args.mb_per_second * 2**20) as server:
+            for label, workers in [("one file at a time", 1), ("concurrent", len(FILES))]:
+                elapsed = timed_download(notebook, server.url, source, workers)
+                print(f"{label:<30} {elapsed:8.2f} s  {total_mb / elapsed:8.1f} MiB/s")
+
+        half = int(args.size_mb * 2**20) // 2
+        with serve(source, drop_first_after=half) as server, tempfile.TemporaryDirectory() as target:
+            notebook["download_files"](server.url, FILES, target)
+            resumed = [p for method, p, r in server.requests if method == "GET" and r == f"bytes={half}-"]
+            print(f"{'interrupted, resumed':<30} intact={same_files(source, target)}  "
+                  f"range requests={len(resumed)}/{len(FILES)}  "
+                  f"transferred={server.bytes_sent / 2**20:.1f}/{total_mb:.1f} MiB")
+            # The files are in place, so a second run has nothing to download
+            again = notebook["download_files"](server.url, FILES, target)
+            print(f"{'second run':<30} downloaded={[n for n, new in again.items() if new]}")
+
+        with serve(source, drop_first_after=half, ignore_range=True) as server, \
+                tempfile.TemporaryDirectory() as target:
+            notebook["download_files"](server.url, FILES, target)
+            print(f"{'interrupted, Range ignored':<30} intact={same_files(source, target)}  "
+                  f"transferred={server.bytes_sent / 2**20:.1f} MiB")
+
+        with serve(source, bad_md5=True) as server, tempfile.TemporaryDirectory() as target:
+            try:
+                notebook["download_file"](f"{server.url}/{FILES[0]}", os.path.join(target, FILES[0]))
+                outcome = "accepted (unexpected)"
+            except IOError as error:
+                outcome = f"rejected: {error}"
+            print(f"{'checksum mismatch':<30} {outcome}; in place={os.path.exists(os.path.join(target, FILES[0]))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""Per-call overhead of the function_app instrumentation layer.
+
+Compares a bare call with the same function wrapped by instrument(), with one
+and with five phases per call, at INFO logging (structured lines emitted to a
+null handler) and with INFO disabled.
+"""
+import argparse
+import logging
+
+from common import load_function_app, measure, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20_000)
+    args = parser.parse_args()
+
+    function_app = load_function_app()
+    phase = function_app.phase
+
+    def bare():
+        return "ok"
+
+    def with_phases():
+        for name in ("connect", "execute", "fetch", "compute", "serialize"):
+            with phase(name):
+                pass
+        return "ok"
+
+    root = logging.getLogger()
+    root.handlers[:] = [logging.NullHandler()]
+    for level in (logging.INFO, logging.WARNING):
+        root.setLevel(level)
+        print(f"logging level {logging.getLevelName(level)}")
+        summarize("bare call", measure(bare, repeat=args.repeat))
+        summarize("instrumented", measure(function_app.instrument("bench", bare), repeat=args.repeat))
+        summarize("instrumented, 5 phases", measure(
+            function_app.instrument("bench_phases", with_phases), repeat=args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Latency of read_csv_from_lakehouse's reader against the iterrows baseline.
+
+Writes CSV files of increasing size to a local lakehouse stand-in and reads
+them back with the original readall + iterrows string concatenation and with
+the streaming reader (full file, and with projection, filter and row limit).
+The last case reads through the parsed-file cache after a warm-up call, which
+is what dashboards polling an unchanged file see.
+"""
+import argparse
+import os
+import tempfile
+import time
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+from common import load_function_app
+from local_lakehouse import LocalLakehouseClient
+
+
+def baseline_read(file_client):
+    csvData = file_client.download_file().readall()
+    df = pd.read_csv(StringIO(csvData.decode("utf-8")))
+    result = ""
+    for index, row in df.iterrows():
+        result = result + "[" + (",".join([str(item) for item in row])) + "]"
+    return result
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--skip-baseline-above", type=int, default=50_000)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated latency per service call")
+    args = parser.parse_args()
+
+    function_app = load_function_app()
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        lakehouse = LocalLakehouseClient(tmp, latency_ms=args.latency_ms)
+        for rows in args.rows:
+            name = f"employees_{rows}.csv"
+            pd.DataFrame({
+                "ID": np.arange(rows),
+                "EmpName": [f"Employee {i}" for i in range(rows)],
+                "DepID": rng.integers(0, 100, rows),
+            }).to_csv(os.path.join(tmp, name), index=False)
+            file_client = lakehouse.connectToFiles().get_file_client(name)
+            size = file_client.get_file_properties().size
+
+            def streaming(**options):
+                batches = function_app.iter_csv_batches(function_app.download_chunks(file_client, size), **options)
+                return lambda: "".join(function_app.format_rows(batch) for batch in batches)
+
+            results = {}
+            if rows <= args.skip_baseline_above:
+                results["iterrows baseline"] = timed(lambda: baseline_read(file_client))
+            results["streaming, full file"] = timed(streaming())
+            results["streaming, filtered"] = timed(
+                streaming(columns=["EmpName"], filters=[["DepID", "<", 10]], max_rows=1000))
+            cache = function_app.LakehouseFileCache()
+
+            def cached():
+                batches = function_app.read_lakehouse_csv(file_client, name, cache=cache)
+                return "".join(function_app.format_rows(batch) for batch in batches)
+
+            cached()
+            results["cached, unchanged file"] = timed(cached)
+            for label, ms in results.items():
+                print(f"rows={rows:>9,}  {label:<22} {ms:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
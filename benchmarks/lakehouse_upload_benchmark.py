@@ -0,0 +1,72 @@
+"""Upload throughput of write_csv_file_in_lakehouse's writer for large outputs.
+
+Builds a DataFrame whose CSV form is about --target-mb megabytes and uploads it
+to a local lakehouse stand-in, comparing the original write-local-file, read
+back, single upload_data path with the spooled writer (CSV and Parquet).
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from common import load_function_app
+from local_lakehouse import LocalLakehouseClient
+
+
+def make_frame(target_mb):
+    rows_per_mb = 20_000  # roughly 50 bytes per CSV row
+    rows = int(target_mb * rows_per_mb)
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "ID": np.arange(rows),
+        "EmpName": pd.Series(rng.integers(0, 10_000, rows)).map("Employee {}".format),
+        "DepID": rng.integers(0, 100, rows),
+        "Salary": rng.random(rows) * 100_000,
+    })
+
+
+def baseline_upload(df, lakehouse, file_name, workdir):
+    local_path = os.path.join(workdir, file_name)
+    df.to_csv(local_path, index=False)
+    file_client = lakehouse.connectToFiles().get_file_client(file_name)
+    with open(local_path, "r") as file:
+        file_client.upload_data(file.read(), overwrite=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--target-mb", type=float, default=1024)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated latency per service call")
+    args = parser.parse_args()
+
+    function_app = load_function_app()
+    df = make_frame(args.target_mb)
+    with tempfile.TemporaryDirectory() as tmp:
+        lakehouse = LocalLakehouseClient(os.path.join(tmp, "lakehouse"), latency_ms=args.latency_ms)
+
+        def spooled(file_format):
+            def upload():
+                buffer, size = function_app.serialize_dataframe(df, file_format)
+                file_client = lakehouse.connectToFiles().get_file_client(f"spooled.{file_format}")
+                with buffer:
+                    function_app.upload_buffer(file_client, buffer, size)
+            return upload
+
+        cases = {
+            "baseline csv (local file)": ("baseline.csv", lambda: baseline_upload(df, lakehouse, "baseline.csv", tmp)),
+            "spooled csv": ("spooled.csv", spooled("csv")),
+            "spooled parquet (snappy)": ("spooled.parquet", spooled("parquet")),
+        }
+        for label, (file_name, upload) in cases.items():
+            start = time.perf_counter()
+            upload()
+            elapsed = time.perf_counter() - start
+            size_mb = os.path.getsize(os.path.join(tmp, "lakehouse", file_name)) / 2**20
+            print(f"{label:<28} {elapsed:8.2f} s  file={size_mb:9.1f} MiB  {size_mb / elapsed:8.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
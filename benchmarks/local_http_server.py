@@ -0,0 +1,122 @@
+"""A local HTTP file server stand-in for the public dataset blob store.
+
+Serves the files under a root directory with what the notebook's downloader
+relies on: HEAD with Content-Length and Content-MD5, and GET with single
+``bytes=<start>-`` Range requests answered by 206. It can also misbehave on
+purpose: throttle each connection, cut the first response of every file after
+some bytes, ignore Range headers or report a wrong checksum.
+"""
+import base64
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEND_CHUNK_SIZE = 64 * 1024
+
+
+class LocalFileServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root, bytes_per_second=None, drop_first_after=None, ignore_range=False, bad_md5=False):
+        super().__init__(("127.0.0.1", 0), FileRequestHandler)
+        self.root = root
+        self.bytes_per_second = bytes_per_second
+        self.drop_first_after = drop_first_after
+        self.ignore_range = ignore_range
+        self.bad_md5 = bad_md5
+        self.lock = threading.Lock()
+        self.dropped = set()  # paths whose first response was already cut
+        self.requests = []  # (method, path, Range header)
+        self.bytes_sent = 0
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class FileRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _resolve(self):
+        path = os.path.join(self.server.root, self.path.lstrip("/"))
+        return path if os.path.isfile(path) else None
+
+    def _send_headers(self, path, status, start, size):
+        self.send_response(status)
+        self.send_header("Content-Length", str(size - start))
+        self.send_header("Accept-Ranges", "none" if self.server.ignore_range else "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{size - 1}/{size}")
+        if status == 200:
+            with open(path, "rb") as file:
+                digest = hashlib.md5(file.read()).digest()
+            if self.server.bad_md5:
+                digest = hashlib.md5(digest).digest()
+            self.send_header("Content-MD5", base64.b64encode(digest).decode())
+        self.end_headers()
+
+    def do_HEAD(self):
+        path = self._resolve()
+        with self.server.lock:
+            self.server.requests.append(("HEAD", self.path, None))
+        if path is None:
+            self.send_error(404)
+            return
+        self._send_headers(path, 200, 0, os.path.getsize(path))
+
+    def do_GET(self):
+        path = self._resolve()
+        requested_range = self.headers.get("Range")
+        with self.server.lock:
+            self.server.requests.append(("GET", self.path, requested_range))
+        if path is None:
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        start = 0
+        if requested_range and not self.server.ignore_range:
+            start = int(requested_range.removeprefix("bytes=").split("-")[0])
+        self._send_headers(path, 206 if start else 200, start, size)
+
+        limit = size - start
+        with self.server.lock:
+            if self.server.drop_first_after is not None and self.path not in self.server.dropped:
+                self.server.dropped.add(self.path)
+                limit = min(limit, self.server.drop_first_after)
+        with open(path, "rb") as file:
+            file.seek(start)
+            sent, began = 0, time.perf_counter()
+            while sent < limit:
+                chunk = file.read(min(SEND_CHUNK_SIZE, limit - sent))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if self.server.bytes_per_second:
+                    delay = sent / self.server.bytes_per_second - (time.perf_counter() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+        with self.server.lock:
+            self.server.bytes_sent += sent
+        if sent < size - start:
+            # Cut the connection mid-body, as a dropped download would
+            self.close_connection = True
+            self.connection.shutdown(2)
+
+
+@contextmanager
+def serve(root, **options):
+    """Run a LocalFileServer over root on a background thread and yield it."""
+    server = LocalFileServer(root, **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
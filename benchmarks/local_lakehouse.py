@@ -0,0 +1,118 @@
+"""A local filesystem stand-in for ``udf.FabricLakehouseClient``.
+
+Implements the subset of the Data Lake file client API that function_app uses
+(upload_data, create_file/append_data/flush_data, download_file and
+get_file_properties), writing under a local root directory.
+"""
+import hashlib
+import os
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class LocalDownloader:
+    def __init__(self, path, offset, length, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        file_size = os.path.getsize(path)
+        self.path = path
+        self.offset = offset or 0
+        end = file_size if length is None else min(file_size, self.offset + length)
+        self.size = max(0, end - self.offset)
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        with open(self.path, "rb") as file:
+            file.seek(self.offset)
+            remaining = self.size
+            while remaining > 0:
+                chunk = file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+
+    def readall(self):
+        return b"".join(self.chunks())
+
+
+class LocalFileClient:
+    def __init__(self, path, latency_ms=0.0):
+        self.path = path
+        self.latency_ms = latency_ms
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def _round_trip(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def upload_data(self, data, length=None, overwrite=False, **kwargs):
+        self._round_trip()
+        if not overwrite and os.path.exists(self.path):
+            raise FileExistsError(self.path)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with open(self.path, "wb") as file:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                file.write(data)
+            else:
+                for chunk in iter(lambda: data.read(DOWNLOAD_CHUNK_SIZE), b""):
+                    file.write(chunk)
+
+    def create_file(self, **kwargs):
+        self._round_trip()
+        open(self.path, "wb").close()
+
+    def append_data(self, data, offset, length=None, **kwargs):
+        # Appends at distinct offsets may run concurrently, as with the real service
+        self._round_trip()
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data if length is None else data[:length], offset)
+        finally:
+            os.close(fd)
+
+    def flush_data(self, offset, **kwargs):
+        self._round_trip()
+        os.truncate(self.path, offset)
+
+    def download_file(self, offset=None, length=None, **kwargs):
+        self._round_trip()
+        return LocalDownloader(self.path, offset, length)
+
+    def get_file_properties(self, **kwargs):
+        self._round_trip()
+        stat = os.stat(self.path)
+        etag = hashlib.md5(f"{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest()
+        return SimpleNamespace(
+            etag=f'"{etag}"',
+            last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            size=stat.st_size,
+        )
+
+    def close(self):
+        pass
+
+
+class LocalDirectoryClient:
+    def __init__(self, root, latency_ms=0.0):
+        self.root = root
+        self.latency_ms = latency_ms
+
+    def get_file_client(self, file_path):
+        return LocalFileClient(os.path.join(self.root, file_path), self.latency_ms)
+
+    def close(self):
+        pass
+
+
+class LocalLakehouseClient:
+    """Stand-in for udf.FabricLakehouseClient; latency_ms simulates each service round trip."""
+
+    def __init__(self, root, latency_ms=0.0):
+        self.root = root
+        self.latency_ms = latency_ms
+
+    def connectToFiles(self):
+        return LocalDirectoryClient(self.root, self.latency_ms)
@@ -0,0 +1,75 @@
+"""Latency of recommend_books over memory-mapped ALS factors.
+
+Writes a synthetic export in the notebook's layout (sorted user IDs, factors,
+item IDs and the items each user has rated) to a local lakehouse stand-in, then
+times the first call, which downloads and memory-maps the files, and warm calls
+for a single user and for a batch of users.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from common import load_function_app, measure, summarize
+from local_lakehouse import LocalLakehouseClient
+
+
+def write_export(root, directory, users, items, rank, rated_per_user):
+    rng = np.random.default_rng(0)
+    path = os.path.join(root, directory)
+    os.makedirs(path, exist_ok=True)
+    user_keys = np.sort(rng.choice(10 * users, users, replace=False)).astype(np.int64)
+    rated_items = rng.integers(0, items, users * rated_per_user).astype(np.int32)
+    arrays = {
+        "user_keys": user_keys,
+        "user_factors": rng.random((users, rank), dtype=np.float32),
+        "item_keys": np.char.mod("%010d", np.arange(items)).astype("U"),
+        "item_factors": rng.random((items, rank), dtype=np.float32),
+        "rated_offsets": np.arange(0, users * rated_per_user + 1, rated_per_user, dtype=np.int64),
+        "rated_items": rated_items,
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    with open(os.path.join(path, "manifest.json"), "w") as file:
+        json.dump({"rank": rank, "users": users, "items": items}, file)
+    return user_keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=270_000)
+    parser.add_argument("--rank", type=int, default=64)
+    parser.add_argument("--rated-per-user", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated latency per service call")
+    args = parser.parse_args()
+
+    function_app = load_function_app()
+    recommend_books = function_app.functions["recommend_books"]
+    with tempfile.TemporaryDirectory() as tmp:
+        user_keys = write_export(tmp, function_app.RECOMMENDATION_EXPORT_DIR, args.users, args.items,
+                                 args.rank, args.rated_per_user)
+        lakehouse = LocalLakehouseClient(tmp, latency_ms=args.latency_ms)
+        rng = np.random.default_rng(1)
+
+        start = time.perf_counter()
+        recommend_books(lakehouse, [int(user_keys[0])], 10)
+        print(f"users={args.users} items={args.items} rank={args.rank}")
+        print(f"{'first call (download + mmap)':<40} {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+        summarize("warm, 1 user", measure(
+            lambda: recommend_books(lakehouse, [int(rng.choice(user_keys))], 10), repeat=args.repeat))
+        summarize(f"warm, {args.batch_size} users", measure(
+            lambda: recommend_books(lakehouse, rng.choice(user_keys, args.batch_size).tolist(), 10),
+            repeat=args.repeat))
+        summarize("warm, unknown user", measure(
+            lambda: recommend_books(lakehouse, [-1], 10), repeat=args.repeat))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Lookup latency and size of the precomputed recommendation store.
+
+Builds a SQLite store in the notebook's layout (one packed record per user plus
+an items table) in a local lakehouse stand-in and times get_user_recommendations
+for uncached users, for users served from the in-process LRU and for a batch.
+The store's size is compared with the same recommendations as an exploded
+Parquet table of (user, item, score, title) rows.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from common import load_function_app, measure, summarize
+from local_lakehouse import LocalLakehouseClient
+
+
+def build_store(path, users, items, k):
+    rng = np.random.default_rng(0)
+    user_ids = rng.choice(10 * users, users, replace=False)
+    recommended = rng.integers(0, items, (users, k)).astype("<i4")
+    scores = np.sort(rng.random((users, k)).astype("<f4"), axis=1)[:, ::-1]
+    titles = [f"Book title {i}" for i in range(items)]
+
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        """
+        PRAGMA journal_mode = OFF;
+        CREATE TABLE recommendations (user_id INTEGER PRIMARY KEY, items BLOB NOT NULL) WITHOUT ROWID;
+        CREATE TABLE items (item_index INTEGER PRIMARY KEY, item_id TEXT, title TEXT);
+        """
+    )
+    connection.executemany(
+        "INSERT INTO recommendations VALUES (?, ?)",
+        ((int(u), r.tobytes() + s.tobytes()) for u, r, s in zip(user_ids, recommended, scores)),
+    )
+    connection.executemany(
+        "INSERT INTO items VALUES (?, ?, ?)", ((i, f"{i:010d}", titles[i]) for i in range(items))
+    )
+    connection.commit()
+    connection.execute("VACUUM")
+    connection.close()
+
+    exploded = pd.DataFrame({
+        "_user_id": np.repeat(user_ids, k),
+        "_item_id": recommended.ravel(),
+        "rating": scores.ravel(),
+    })
+    exploded["Book-Title"] = np.asarray(titles, dtype=object)[exploded["_item_id"]]
+    return user_ids, exploded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="simulated latency per service call")
+    args = parser.parse_args()
+
+    function_app = load_function_app()
+    lookup = function_app.functions["get_user_recommendations"]
+    with tempfile.TemporaryDirectory() as tmp:
+        store_path = os.path.join(tmp, function_app.RECOMMENDATION_STORE_PATH)
+        os.makedirs(os.path.dirname(store_path))
+        user_ids, exploded = build_store(store_path, args.users, args.items, args.k)
+        parquet_path = os.path.join(tmp, "userRecs.parquet")
+        exploded.to_parquet(parquet_path, index=False)
+        print(f"users={args.users} k={args.k}")
+        print(f"sqlite store          {os.path.getsize(store_path) / 2**20:8.1f} MiB")
+        print(f"exploded parquet      {os.path.getsize(parquet_path) / 2**20:8.1f} MiB")
+
+        lakehouse = LocalLakehouseClient(tmp, latency_ms=args.latency_ms)
+        start = time.perf_counter()
+        lookup(lakehouse, [int(user_ids[0])])
+        print(f"{'first call (download)':<40} {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+        uncached = iter(user_ids[1:].tolist())
+        summarize("uncached user", measure(lambda: lookup(lakehouse, [next(uncached)]), repeat=args.repeat))
+        hot = user_ids[:100].tolist()
+        rng = np.random.default_rng(1)
+        summarize("cached user (LRU)", measure(lambda: lookup(lakehouse, [hot[rng.integers(100)]]), repeat=args.repeat))
+        summarize(f"{args.batch_size} uncached users", measure(
+            lambda: lookup(lakehouse, [next(uncached) for _ in range(args.batch_size)]), repeat=args.repeat // 10))
+        start = time.perf_counter()
+        exploded_user = pd.read_parquet(parquet_path, filters=[("_user_id", "==", int(user_ids[1]))])
+        print(f"{'exploded parquet, one user (for scale)':<40} {(time.perf_counter() - start) * 1000:9.1f} ms"
+              f"  rows={len(exploded_user)}")
+
+
+if __name__ == "__main__":
+    main()
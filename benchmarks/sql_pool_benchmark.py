@@ -0,0 +1,70 @@
+"""Warm-call latency of pooled SQL connections versus connect-per-call.
+
+A local SQLite database stands in for ``udf.FabricSqlConnection``. SQLite opens
+connections in microseconds, so ``--connect-latency-ms`` adds a sleep to every
+connect() to model the TLS handshake and token login of Azure SQL.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from common import load_function_app, measure, summarize
+
+QUERY = "SELECT EmpName, DepID FROM Employee;"
+
+
+class SqliteSqlConnection:
+    """Stand-in for udf.FabricSqlConnection backed by a SQLite file."""
+
+    def __init__(self, path, connect_latency_ms):
+        self.path = path
+        self.connect_latency_ms = connect_latency_ms
+
+    def connect(self):
+        time.sleep(self.connect_latency_ms / 1000)
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+
+def create_database(path, rows):
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE Employee (EmpName TEXT, DepID INTEGER)")
+        connection.executemany(
+            "INSERT INTO Employee VALUES (?, ?)", ((f"Employee {i}", i % 50) for i in range(rows))
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--connect-latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    function_app = load_function_app()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        create_database(path, args.rows)
+        sql_db = SqliteSqlConnection(path, args.connect_latency_ms)
+
+        def connect_per_call():
+            connection = sql_db.connect()
+            try:
+                function_app.fetch_all(connection, QUERY)
+            finally:
+                connection.close()
+
+        pool = function_app.get_sql_pool("benchmark", sql_db)
+
+        def pooled():
+            pool.run(lambda connection: function_app.fetch_all(connection, QUERY))
+
+        print(f"rows={args.rows} connect latency={args.connect_latency_ms} ms")
+        summarize("connect per call", measure(connect_per_call, repeat=args.repeat))
+        summarize("pooled (warm)", measure(pooled, repeat=args.repeat))
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Peak memory and latency of transform_data's normalization.
+
+Compares the original implementation (np.array + full-size temporaries + str()
+response) with the in-place engine in float64 and float32. Note that the text response is
+NumPy's summarized repr, so only the npy response carries the full matrix.
+Peak memory is measured with tracemalloc, which tracks NumPy allocations.
+"""
+import argparse
+import warnings
+import time
+import tracemalloc
+
+import numpy as np
+
+from common import load_function_app
+
+
+def baseline(items):
+    np_data = np.array(items)
+    min_vals = np.min(np_data, axis=0)
+    max_vals = np.max(np_data, axis=0)
+    normalized_data = (np_data - min_vals) / (max_vals - min_vals)
+    column_means = np.mean(np_data, axis=0)
+    return f"Normalized Data: {normalized_data} and Column Means: {column_means}"
+
+
+def profile(fn):
+    # Time without tracemalloc, which slows allocations down, then measure memory
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 2**20, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--columns", type=int, default=8)
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore", RuntimeWarning)  # the baseline divides by zero on constant columns
+    function_app = load_function_app()
+    transform_data = function_app.functions["transform_data"]
+    rng = np.random.default_rng(0)
+    for rows in args.rows:
+        matrix = rng.random((rows, args.columns))
+        matrix[:, 0] = 1.0  # a constant column
+        items = matrix.tolist()
+        payload_mb = matrix.nbytes / 2**20
+
+        cases = {
+            "baseline (text)": lambda: baseline(items),
+            "engine float64 (text)": lambda: transform_data({"data": {"items": items}}),
+            "engine float64 (npy)": lambda: transform_data(
+                {"data": {"items": items}, "format": "npy"}),
+            "engine float32 (npy)": lambda: transform_data(
+                {"data": {"items": items}, "format": "npy", "dtype": "float32"}),
+        }
+        print(f"rows={rows:,} columns={args.columns} (float64 matrix = {payload_mb:.1f} MiB)")
+        for label, fn in cases.items():
+            latency, peak, size = profile(fn)
+            print(f"  {label:<22} {latency:9.1f} ms  peak={peak:8.1f} MiB  response={size / 2**20:8.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()